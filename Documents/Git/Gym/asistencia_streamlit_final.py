@@ -1,248 +1,643 @@
-import streamlit as st
-from datetime import datetime
-import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import time
-# Nota: Ya no necesitamos os ni el ARCHIVO_CSV
-
-# --- CONFIGURACIÓN DE GOOGLE SHEETS ---
-# Lee el nombre de la hoja de cálculo y la cuenta de servicio del archivo secrets.toml
-# El nombre de la Hoja de Cálculo debe ser un "Secret" o estar aquí si lo prefieres,
-# pero lo leeremos directamente de st.secrets para mayor consistencia.
-try:
-    NOMBRE_HOJA_CALCULO = st.secrets["nombre_hoja_calculo"]
-    NOMBRE_HOJA = "Hoja 1" # Ajusta si el nombre de la pestaña es diferente
-except KeyError:
-    st.error("Error: Falta configurar 'nombre_hoja_calculo' en secrets.toml")
-    st.stop()
-
-
-# Inicialización de Google Sheets (usando caché para no autenticar en cada ejecución)
-@st.cache_resource(ttl=None) 
-def get_sheets_client():
-    """Conecta con Google Sheets usando la cuenta de servicio desde st.secrets."""
-    try:
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        
-        # Lee las credenciales como un diccionario de Python desde st.secrets
-        creds_dict = st.secrets["gcp_service_account"] 
-        
-        # Autoriza con el diccionario de credenciales
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        client = gspread.authorize(creds)
-        return client
-    except Exception as e:
-        # Esto atrapará errores si el JSON es inválido o faltan campos
-        st.error(f"❌ Error al conectar con Google Sheets. Verifica tus secretos en secrets.toml y que las APIs estén habilitadas. Error: {e}")
-        st.stop() # Detiene la ejecución para evitar errores posteriores
-        return None
-
-# --- Funciones de Lógica de Negocio (Ahora para Sheets) ---
-
-def marcar_asistencia(nombre, apellido):
-    """Registra la asistencia directamente en Google Sheets."""
-    client = get_sheets_client()
-    
-    try:
-        # Abrir la hoja de cálculo y seleccionar la pestaña
-        sheet = client.open(NOMBRE_HOJA_CALCULO).worksheet(NOMBRE_HOJA)
-        
-        # Preparar los datos
-        ahora = datetime.now()
-        fecha = ahora.strftime("%Y-%m-%d")
-        hora = ahora.strftime("%H:%M:%S")
-        
-        # Escribir la fila
-        registro = [fecha, hora, nombre, apellido]
-        sheet.append_row(registro)
-        
-        return True
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error(f"❌ Error: Hoja de cálculo '{NOMBRE_HOJA_CALCULO}' no encontrada. Verifica el nombre y la compartición.")
-        return False
-    except Exception as e:
-        st.error(f"❌ Error al escribir en Google Sheets. ¿Está compartida con la cuenta de servicio? Error: {e}")
-        return False
-
-# ¡Se mantiene el caché para la lectura! Es esencial para el rendimiento.
-# Se le añade un "hash" del cliente para forzar la recarga si las credenciales cambian.
-@st.cache_data(show_spinner="Cargando datos de Google Sheets...") 
-def leer_asistencias():
-    """Lee todos los registros de Google Sheets."""
-    client = get_sheets_client()
-
-    try:
-        sheet = client.open(NOMBRE_HOJA_CALCULO).worksheet(NOMBRE_HOJA)
-        # Obtener todos los valores, incluyendo el encabezado
-        data = sheet.get_all_values()
-        
-        if not data:
-             return pd.DataFrame(columns=["Fecha", "Hora", "Nombre", "Apellido"])
-
-        # El primer elemento es el encabezado
-        headers = data[0]
-        records = data[1:]
-        
-        # Crear DataFrame
-        df = pd.DataFrame(records, columns=headers)
-        
-        # Asegurarse de que la columna 'Fecha' sea de tipo datetime para el filtro
-        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce') 
-        return df
-    except Exception as e:
-        st.error(f"❌ Error al leer de Google Sheets. Verifica que el nombre de la hoja sea correcto. Error: {e}")
-        return pd.DataFrame(columns=["Fecha", "Hora", "Nombre", "Apellido"])
-
-def limpiar_registros_sheets():
-    """Borra todos los registros (dejando solo el encabezado) de Google Sheets."""
-    client = get_sheets_client()
-    
-    try:
-        sheet = client.open(NOMBRE_HOJA_CALCULO).worksheet(NOMBRE_HOJA)
-        # Borrar todas las filas excepto la primera (encabezado)
-        sheet.delete_rows(2, sheet.row_count)
-        return True
-    except Exception as e:
-        st.error(f"❌ Error al limpiar la hoja de cálculo: {e}")
-        return False
-
-# --- Funciones de Estado de Limpieza (Mismo uso de Session State) ---
-
-if 'confirmar_limpieza' not in st.session_state:
-    st.session_state.confirmar_limpieza = False
-
-def solicitar_confirmacion():
-    st.session_state.confirmar_limpieza = True
-
-def cancelar_limpieza():
-    st.session_state.confirmar_limpieza = False
-    st.rerun()
-
-def ejecutar_limpieza_y_recargar():
-    if limpiar_registros_sheets():
-        st.session_state.confirmar_limpieza = False
-        st.success("Historial borrado exitosamente de Google Sheets.")
-        # Limpiar el caché de la función de lectura para que recargue los datos
-        st.cache_data.clear() 
-        time.sleep(1) # Pequeña pausa para que se vea el mensaje de éxito
-        st.rerun()
-
-# --- Configuración y Diseño de la Interfaz (Streamlit) ---
-
-st.set_page_config(page_title="Control de Asistencia Gym - Google Sheets", layout="wide")
-st.title("Sistema de Control de Asistencia (Con Google Sheets) 📝")
-st.markdown("---")
-
-# ===================================================================
-# 1. SECCIÓN DE REGISTRO
-# ===================================================================
-
-col_form, col_spacer = st.columns([1, 0.5])
-
-with col_form:
-    st.header("1. Marcar Asistencia")
-    
-    with st.form("form_asistencia"):
-        nombre = st.text_input("Nombre:")
-        apellido = st.text_input("Apellido:")
-        
-        submit_button = st.form_submit_button("REGISTRAR ASISTENCIA")
-
-    if submit_button:
-        if nombre and apellido:
-            if marcar_asistencia(nombre.strip(), apellido.strip()):
-                st.success(f"✅ ¡Asistencia registrada para **{nombre} {apellido}** en Google Sheets!")
-                # Limpiar el caché y forzar la recarga
-                st.cache_data.clear() 
-                st.rerun()
-        else:
-            st.error("Por favor, completá tu nombre y apellido.")
-
-st.markdown("---")
-
-# ===================================================================
-# 2. SECCIÓN DE VISUALIZACIÓN, FILTROS Y REPORTES
-# ===================================================================
-
-st.header("2. Lista Histórica de Asistencias")
-
-df_asistencias = leer_asistencias()
-
-if df_asistencias.empty or len(df_asistencias) == 0:
-    st.info("Aún no hay asistencias registradas.")
-else:
-    # --- FILTROS ---
-    st.subheader("Filtros y Búsqueda")
-    
-    col_search, col_date, col_total = st.columns(3)
-
-    # Filtro por Nombre/Apellido (Búsqueda)
-    filtro_texto = col_search.text_input("Buscar por Nombre o Apellido:", key="filtro_nombre")
-    
-    # Filtro por Fecha (Reporte por Fecha)
-    fecha_min = df_asistencias['Fecha'].min().date() if not df_asistencias['Fecha'].isnull().all() else datetime.today().date()
-    fecha_max = df_asistencias['Fecha'].max().date() if not df_asistencias['Fecha'].isnull().all() else datetime.today().date()
-    
-    filtro_fecha = col_date.date_input("Filtrar por Fecha Específica:", 
-                                       value=None, 
-                                       min_value=fecha_min, 
-                                       max_value=fecha_max,
-                                       key="filtro_fecha")
-
-   # Aplicar filtros
-    df_filtrado = df_asistencias.copy()
-    
-    # PASO CLAVE 1: Crear la columna combinada y convertirla a minúsculas
-    df_filtrado['Nombre_Completo'] = (
-        df_filtrado['Nombre'].astype(str) + ' ' + df_filtrado['Apellido'].astype(str)
-    ).str.lower()
-    
-    # ... (Filtro por fecha si aplica) ...
-
-    if filtro_texto:
-        # PASO CLAVE 2: Convertir el texto de búsqueda a minúsculas
-        texto_busqueda_lower = filtro_texto.lower()
-        
-        df_filtrado = df_filtrado[
-            df_filtrado['Nombre_Completo'].str.contains(texto_busqueda_lower, na=False)
-        ]
-        
-    df_filtrado = df_filtrado.drop(columns=['Nombre_Completo'])
-    
-    # Mostrar totales
-    col_total.metric(label="Total de Asistencias (Filtradas)", value=len(df_filtrado))
-    
-    # Mostrar la tabla filtrada
-    st.markdown("---")
-    st.subheader(f"Resultados ({len(df_filtrado)})")
-    st.dataframe(df_filtrado, use_container_width=True)
-
-    # --- DESCARGA Y LIMPIEZA ---
-    col_download, col_clean = st.columns([1, 1])
-
-    with col_download:
-        st.download_button(
-            label="Descargar Reporte (CSV)",
-            data=df_filtrado.to_csv(index=False).encode('utf-8'),
-            file_name=f'asistencias_gym_reporte_{datetime.now().strftime("%Y%m%d")}.csv',
-            mime='text/csv',
-        )
-    
-    with col_clean:
-        st.markdown("### Administración")
-        
-        if not st.session_state.confirmar_limpieza:
-            if st.button("🔴 LIMPIAR TODO EL HISTORIAL (PELIGRO)", type="secondary", on_click=solicitar_confirmacion):
-                pass
-        else:
-            # Diálogo de confirmación
-            st.warning("⚠️ ¿Estás *totalmente* seguro? Esta acción eliminará **TODO** el historial de asistencias en Google Sheets y es irreversible.")
-            
-            col_confirm_si, col_confirm_no = st.columns(2)
-            
-            with col_confirm_si:
-                st.button("SÍ, BORRAR DEFINITIVAMENTE", type="primary", on_click=ejecutar_limpieza_y_recargar)
-            with col_confirm_no:
-                st.button("NO, CANCELAR", on_click=cancelar_limpieza)
-
+import streamlit as st
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import gspread
+import requests
+from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession
+import atexit
+import csv
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+
+# --- CACHÉ EN DISCO ---
+# El caché de Streamlit vive solo en memoria: tras un reinicio del contenedor
+# habría que volver a bajar y parsear toda la hoja. Guardamos una copia en
+# Feather junto con la marca de modificación de Drive para arrancar en frío
+# leyendo del disco si la hoja no cambió. Los archivos van nombrados por
+# (id de hoja de cálculo, pestaña): varias réplicas que compartan este
+# directorio reutilizan la misma copia, y un cambio de hoja en los secretos
+# nunca puede servir datos de la hoja anterior.
+DIRECTORIO_CACHE = Path.home() / '.cache' / 'gym'
+try:
+    # Una sola vez al importar, en vez de un mkdir por cada guardado.
+    DIRECTORIO_CACHE.mkdir(parents=True, exist_ok=True)
+except OSError:
+    pass  # Sin permisos para crearlo: la app funciona igual sin el caché en disco.
+
+def _rutas_cache(spreadsheet):
+    """Rutas del Feather y su sidecar para esta (hoja de cálculo, pestaña)."""
+    clave = f"{spreadsheet.id}_{NOMBRE_HOJA.replace(' ', '_')}"
+    return (DIRECTORIO_CACHE / f'asistencias_{clave}.feather',
+            DIRECTORIO_CACHE / f'asistencias_{clave}.json')
+# Nota: Ya no necesitamos os ni el ARCHIVO_CSV
+
+# --- COLA DE ESCRITURAS ---
+# Escribir en Sheets son cientos de milisegundos de HTTPS; hacerlo en el hilo
+# que renderiza la UI congela la app durante ese tiempo. Las filas se encolan
+# acá y un hilo en segundo plano las sube por lotes (una sola llamada
+# append_rows por lote, que también ahorra cuota de escritura).
+MAX_FILAS_POR_LOTE = 20    # Tamaño máximo de cada append_rows...
+SEGUNDOS_POR_LOTE = 5      # ...y cuánto espera el hilo juntando filas para un lote.
+MAX_REINTENTOS_LOTE = 3    # Reintentos ante errores transitorios de la API.
+MAX_REENCOLADOS = 5        # Veces que una fila fallida vuelve a la cola antes de ir a disco.
+
+# Filas que no se pudieron subir ni reintentando: quedan acá para
+# recuperarlas a mano (mismo formato de columnas que la hoja).
+RUTA_NO_SUBIDAS = DIRECTORIO_CACHE / 'asistencias_no_subidas.csv'
+
+_log = logging.getLogger(__name__)
+
+# La cola guarda tuplas (fila, veces_reencolada).
+_cola_escrituras = queue.Queue()
+
+# --- CONFIGURACIÓN DE GOOGLE SHEETS ---
+# Lee el nombre de la hoja de cálculo y la cuenta de servicio del archivo secrets.toml
+# El nombre de la Hoja de Cálculo debe ser un "Secret" o estar aquí si lo prefieres,
+# pero lo leeremos directamente de st.secrets para mayor consistencia.
+try:
+    NOMBRE_HOJA_CALCULO = st.secrets["nombre_hoja_calculo"]
+    NOMBRE_HOJA = "Hoja 1" # Ajusta si el nombre de la pestaña es diferente
+except KeyError:
+    st.error("Error: Falta configurar 'nombre_hoja_calculo' en secrets.toml")
+    st.stop()
+
+
+# Inicialización de Google Sheets (usando caché para no autenticar en cada ejecución)
+@st.cache_resource(ttl=None) 
+def get_sheets_client():
+    """Conecta con Google Sheets usando la cuenta de servicio desde st.secrets."""
+    try:
+        scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+
+        # Lee las credenciales como un diccionario de Python desde st.secrets
+        creds_dict = st.secrets["gcp_service_account"]
+
+        # Autoriza con el diccionario de credenciales
+        creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
+
+        # Sesión propia con pool de conexiones keep-alive: cada llamada a la
+        # API reutiliza la conexión TLS ya abierta contra el endpoint de
+        # Google en vez de pagar un handshake (~100ms) por request.
+        session = AuthorizedSession(creds)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=8)
+        session.mount('https://', adapter)
+
+        client = gspread.Client(auth=creds, session=session)
+        return client
+    except Exception as e:
+        # Esto atrapará errores si el JSON es inválido o faltan campos
+        st.error(f"❌ Error al conectar con Google Sheets. Verifica tus secretos en secrets.toml y que las APIs estén habilitadas. Error: {e}")
+        st.stop() # Detiene la ejecución para evitar errores posteriores
+        return None
+
+# Handles cacheados: client.open(nombre) hace una búsqueda por título en
+# Drive (una llamada HTTP extra) y worksheet() otra más; acá se resuelven una
+# sola vez por proceso en vez de dentro de cada operación.
+@st.cache_resource
+def get_spreadsheet():
+    """Handle de la hoja de cálculo, resuelto una sola vez por proceso."""
+    client = get_sheets_client()
+    # Con el secreto opcional 'spreadsheet_id', open_by_key va directo por id
+    # sin pasar por la búsqueda por título.
+    sheet_id = st.secrets.get("spreadsheet_id")
+    if sheet_id:
+        return client.open_by_key(sheet_id)
+    return client.open(NOMBRE_HOJA_CALCULO)
+
+@st.cache_resource
+def get_worksheet():
+    """Handle de la pestaña de registros, resuelto una sola vez por proceso."""
+    return get_spreadsheet().worksheet(NOMBRE_HOJA)
+
+# --- Funciones de Lógica de Negocio (Ahora para Sheets) ---
+
+def _subir_lote(sheet, lote):
+    """Sube un lote de filas con una sola llamada append_rows, con reintentos."""
+    for intento in range(MAX_REINTENTOS_LOTE):
+        try:
+            # append_rows manda todas las filas en un único request HTTP
+            # (spreadsheets.values.append), en vez de uno por fila.
+            sheet.append_rows(lote, value_input_option='USER_ENTERED')
+            return True
+        except Exception:
+            time.sleep(2 ** intento)  # Backoff simple ante 429/errores de red.
+    return False
+
+def _persistir_filas_caidas(filas):
+    """Guarda en disco las filas que no se pudieron subir, para recuperarlas."""
+    try:
+        with open(RUTA_NO_SUBIDAS, 'a', newline='') as f:
+            csv.writer(f).writerows(filas)
+        _log.error("No se pudieron subir %d asistencias a Sheets; quedaron en %s",
+                   len(filas), RUTA_NO_SUBIDAS)
+    except OSError:
+        # Último recurso: que al menos queden completas en el log.
+        _log.error("No se pudieron subir ni persistir %d asistencias: %r",
+                   len(filas), filas)
+
+def _worker_escrituras(sheet):
+    """Consume la cola de escrituras y sube las filas a Sheets por lotes."""
+    while True:
+        lote = [_cola_escrituras.get()]
+        # Esperar un poco por si llegan más filas que puedan ir en el mismo lote
+        limite = time.time() + SEGUNDOS_POR_LOTE
+        while len(lote) < MAX_FILAS_POR_LOTE:
+            restante = limite - time.time()
+            if restante <= 0:
+                break
+            try:
+                lote.append(_cola_escrituras.get(timeout=restante))
+            except queue.Empty:
+                break
+        if not _subir_lote(sheet, [fila for fila, _ in lote]):
+            # El lote vuelve a la cola para el próximo ciclo (con tope); lo
+            # que supere el tope se persiste en disco en vez de perderse.
+            caidas = []
+            for fila, reencolados in lote:
+                if reencolados + 1 < MAX_REENCOLADOS:
+                    _cola_escrituras.put((fila, reencolados + 1))
+                else:
+                    caidas.append(fila)
+            if caidas:
+                _persistir_filas_caidas(caidas)
+        for _ in lote:
+            _cola_escrituras.task_done()
+
+def _flush_al_salir(sheet):
+    """Sube lo que haya quedado en la cola al cerrarse el proceso."""
+    filas = []
+    while True:
+        try:
+            filas.append(_cola_escrituras.get_nowait()[0])
+        except queue.Empty:
+            break
+    if filas and not _subir_lote(sheet, filas):
+        # Ya no habrá otro ciclo: directo a disco para no perder registros.
+        _persistir_filas_caidas(filas)
+
+@st.cache_resource
+def _iniciar_worker_escrituras():
+    """Lanza el hilo de escrituras (una sola vez por proceso)."""
+    # El handle de la hoja se resuelve acá, en el hilo del script, para que el
+    # worker no tenga que tocar st.secrets ni el caché de Streamlit.
+    sheet = get_worksheet()
+    hilo = threading.Thread(
+        target=_worker_escrituras, args=(sheet,),
+        daemon=True, name='gym-escrituras',
+    )
+    hilo.start()
+    atexit.register(_flush_al_salir, sheet)
+    return hilo
+
+def marcar_asistencia(nombre, apellido):
+    """Encola la asistencia; el hilo en segundo plano la sube a Sheets."""
+    try:
+        _iniciar_worker_escrituras()
+
+        # Preparar los datos
+        ahora = datetime.now()
+        fecha = ahora.strftime("%Y-%m-%d")
+        hora = ahora.strftime("%H:%M:%S")
+
+        # Encolar y volver de inmediato: la UI no espera el viaje a la API.
+        _cola_escrituras.put(([fecha, hora, nombre, apellido], 0))
+        return True
+    except Exception as e:
+        st.error(f"❌ Error al registrar la asistencia. Error: {e}")
+        return False
+
+COLUMNAS = ["Fecha", "Hora", "Nombre", "Apellido"]
+
+# Parámetros comunes de lectura: valores sin formatear, con fechas y horas
+# como números de serie de Sheets en vez de texto a parsear fila por fila.
+_PARAMS_LECTURA = {
+    'valueRenderOption': 'UNFORMATTED_VALUE',
+    'dateTimeRenderOption': 'SERIAL_NUMBER',
+}
+
+def _parsear_registros(records, headers=None):
+    """Convierte filas crudas de la API (números de serie) en un DataFrame."""
+    columnas = headers or COLUMNAS
+    # values.get/batchGet recortan las celdas vacías del final de cada fila
+    # (el get_all_values de antes las rellenaba): completamos cada fila al
+    # ancho del encabezado o el DataFrame no se puede construir.
+    records = gspread.utils.fill_gaps(records, cols=len(columnas))
+
+    # Crear DataFrame con columnas respaldadas por Arrow (ocupan menos
+    # memoria que los str de Python y las operaciones de texto van en C)
+    df = pd.DataFrame(records, columns=columnas).convert_dtypes(dtype_backend='pyarrow')
+
+    # 'Fecha' llega como número de serie (días desde 1899-12-30): una sola
+    # conversión vectorizada, sin parseo de texto por fila. Las filas que la
+    # hoja guardó como texto se parsean con format= fijo, que usa la ruta C
+    # de pandas en vez del parser por fila de dateutil. El pase por float64
+    # importa: sobre una columna string[pyarrow], to_numeric deja los textos
+    # no numéricos como NaN de float (no NA de pyarrow) y un isna() directo
+    # no los vería, salteando el fallback de texto.
+    fecha_serial = pd.to_numeric(df['Fecha'], errors='coerce').astype('float64')
+    fecha = pd.to_datetime(fecha_serial, unit='D', origin='1899-12-30', errors='coerce')
+    sin_serial = fecha_serial.isna()
+    if sin_serial.any():
+        fecha.loc[sin_serial] = pd.to_datetime(
+            df['Fecha'][sin_serial].astype(str),
+            format='%Y-%m-%d', errors='coerce', cache=True
+        )
+    # Resolución de segundos: de sobra para fechas de asistencia.
+    df['Fecha'] = fecha.astype('datetime64[s]')
+
+    # 'Hora' llega como fracción del día; la volvemos a HH:MM:SS para mostrarla.
+    # La columna se reconstruye entera como serie de texto: asignar strings
+    # dentro de la columna double[pyarrow] que deja convert_dtypes falla con
+    # ArrowInvalid bajo pandas 3.
+    hora_serial = pd.to_numeric(df['Hora'], errors='coerce').astype('float64')
+    con_serial = hora_serial.notna()
+    if con_serial.any():
+        # Redondear al segundo más cercano antes de formatear: la fracción
+        # del día en float64 suele caer apenas por debajo del segundo exacto
+        # y strftime trunca, mostrando la mitad de las horas un segundo antes.
+        formateada = pd.to_datetime(
+            (hora_serial * 86400).round(), unit='s', errors='coerce'
+        ).dt.strftime('%H:%M:%S')
+        df['Hora'] = formateada.where(
+            con_serial, df['Hora'].astype(str)
+        ).astype('string[pyarrow]')
+    return _agregar_columna_busqueda(df)
+
+def _agregar_columna_busqueda(df):
+    """Precalcula la columna en minúsculas que usa el buscador."""
+    # Se calcula una sola vez junto con el DataFrame (y se persiste en el
+    # Feather): el buscador hace un único scan vectorizado sobre esta columna
+    # en cada tecleo, en vez de reconstruir la concatenación y correr dos
+    # pasadas de regex por Nombre y Apellido.
+    df['_search'] = (
+        df['Nombre'].astype(str).str.lower() + ' ' + df['Apellido'].astype(str).str.lower()
+    ).astype('string[pyarrow]')
+    return df
+
+def _descargar_asistencias(spreadsheet):
+    """Baja todos los registros con un solo request (values.batchGet)."""
+    respuesta = spreadsheet.values_batch_get(
+        [f"'{NOMBRE_HOJA}'!A:D"],
+        params=_PARAMS_LECTURA,
+    )
+    data = respuesta['valueRanges'][0].get('values', [])
+
+    if len(data) < 2:  # Hoja vacía o solo el encabezado
+        df = _agregar_columna_busqueda(pd.DataFrame(columns=COLUMNAS))
+        return df, len(data), None
+
+    # El primer elemento es el encabezado; también devolvemos el índice y el
+    # contenido crudo de la última fila para las lecturas incrementales.
+    df = _parsear_registros(data[1:], headers=data[0])
+    return df, len(data), data[-1]
+
+@st.cache_resource
+def _estado_lector():
+    """Estado del lector incremental, compartido por todo el proceso."""
+    return {'df': None, 'modificado': None, 'ultima_fila': 0,
+            'fila_cruda': None, 'fecha_day': None, 'rutas': None}
+
+def _actualizar_estado(estado, df, modificado, ultima_fila, fila_cruda):
+    estado['df'] = df
+    estado['modificado'] = modificado
+    estado['ultima_fila'] = ultima_fila
+    estado['fila_cruda'] = fila_cruda
+    # La vista por día de 'Fecha' se materializa una sola vez acá: el filtro
+    # por fecha la compara directo contra np.datetime64 sin reconvertir la
+    # columna entera en cada recomputación.
+    estado['fecha_day'] = df['Fecha'].values.astype('datetime64[D]')
+    # Los extremos del rango de fechas también se calculan una sola vez: el
+    # date_input los leía con tres pasadas O(N) por la columna en cada rerun.
+    df.attrs['fecha_min'] = df['Fecha'].min()
+    df.attrs['fecha_max'] = df['Fecha'].max()
+
+def _cargar_desde_disco(estado):
+    """Intenta poblar el estado del lector desde el Feather y su sidecar."""
+    ruta_feather, ruta_sidecar = estado['rutas']
+    try:
+        meta = json.loads(ruta_sidecar.read_text())
+        df = pd.read_feather(ruta_feather)
+    except (OSError, ValueError, KeyError):
+        return  # Sin caché en disco (o formato viejo): seguimos sin él.
+    if '_search' not in df.columns:  # Feather escrito por una versión vieja
+        df = _agregar_columna_busqueda(df)
+    _actualizar_estado(estado, df, meta.get('modificado'),
+                       meta.get('ultima_fila', 0), meta.get('fila_cruda'))
+
+def _guardar_en_disco(estado):
+    """Actualiza el caché en disco para el próximo arranque en frío."""
+    ruta_feather, ruta_sidecar = estado['rutas']
+    try:
+        estado['df'].to_feather(ruta_feather, compression='lz4')
+        ruta_sidecar.write_text(json.dumps({
+            'modificado': estado['modificado'],
+            'ultima_fila': estado['ultima_fila'],
+            'fila_cruda': estado['fila_cruda'],
+        }))
+    except OSError:
+        pass  # Sin espacio o sin permisos: la app funciona igual sin el Feather.
+
+def _leer_delta(spreadsheet, estado, modificado):
+    """Baja solo las filas nuevas y las concatena al DataFrame cacheado.
+
+    Devuelve None si el delta no alcanza (hoja vaciada o editada por encima
+    de la última fila vista): en ese caso corresponde una lectura completa.
+    """
+    if estado['ultima_fila'] < 2 or estado['fila_cruda'] is None:
+        return None
+
+    # Pedimos desde la última fila ya vista (inclusive): si su contenido no
+    # coincide con lo cacheado, la hoja fue vaciada o editada y el
+    # append-only no vale.
+    respuesta = spreadsheet.values_get(
+        f"'{NOMBRE_HOJA}'!A{estado['ultima_fila']}:D",
+        params=_PARAMS_LECTURA,
+    )
+    filas = respuesta.get('values', [])
+    if not filas or filas[0] != estado['fila_cruda']:
+        return None
+
+    nuevas = filas[1:]
+    if not nuevas:
+        # modifiedTime cambió pero no hay filas nuevas: desde acá no se puede
+        # distinguir un cambio de formato de una edición in-place a una fila
+        # vieja, así que no vale re-sellar lo cacheado como vigente.
+        return None
+
+    df = pd.concat([estado['df'], _parsear_registros(nuevas)], ignore_index=True)
+    _actualizar_estado(estado, df, modificado,
+                       estado['ultima_fila'] + len(nuevas), filas[-1])
+    _guardar_en_disco(estado)
+    return df
+
+# Cada cuántos segundos vale la pena re-chequear el modifiedTime en Drive.
+# El chequeo es solo metadata (sin bajar datos), así que puede ser frecuente:
+# las ediciones externas se ven en segundos sin re-bajar nada si no cambió.
+SEGUNDOS_ENTRE_CHEQUEOS = 5
+
+@st.cache_resource(ttl=SEGUNDOS_ENTRE_CHEQUEOS, show_spinner=False)
+def _modificado_actual():
+    """modifiedTime vigente de la hoja (metadata; el TTL limita la frecuencia)."""
+    # get_lastUpdateTime() re-consulta Drive en cada llamada; la propiedad
+    # lastUpdateTime devuelve lo cacheado al crear el handle, que acá vive
+    # todo el proceso y nunca reflejaría cambios.
+    return get_spreadsheet().get_lastUpdateTime()
+
+# cache_resource devuelve la misma referencia en cada rerun: a diferencia de
+# cache_data, no vuelve a hashear/picklear el DataFrame entero en cada acceso
+# (un costo O(filas×columnas) por interacción). A cambio, quien quiera mutar
+# el frame debe hacer su propio .copy().
+@st.cache_resource(max_entries=1, show_spinner="Cargando datos de Google Sheets...")
+def _cargar_asistencias(modificado):
+    """Carga los registros para esta versión (modifiedTime) de la hoja.
+
+    El modifiedTime es parte de la clave del caché, como el mtime de un
+    archivo: una versión nueva de la hoja genera una clave nueva y el caché
+    se invalida solo — la data servida nunca puede ser más vieja que la
+    marca con la que se pidió.
+    """
+    estado = _estado_lector()
+
+    spreadsheet = get_spreadsheet()
+    estado['rutas'] = _rutas_cache(spreadsheet)
+
+    # Arranque en frío: levantar la última versión desde el disco.
+    if estado['df'] is None:
+        _cargar_desde_disco(estado)
+
+    # La hoja no cambió desde la última lectura: devolvemos lo que tenemos.
+    if estado['df'] is not None and estado['modificado'] == modificado:
+        return estado['df']
+
+    # La hoja creció: bajar solo el delta y concatenarlo.
+    if estado['df'] is not None:
+        df = _leer_delta(spreadsheet, estado, modificado)
+        if df is not None:
+            return df
+
+    # Primera lectura, o la hoja fue vaciada/editada: lectura completa.
+    df, ultima_fila, fila_cruda = _descargar_asistencias(spreadsheet)
+    _actualizar_estado(estado, df, modificado, ultima_fila, fila_cruda)
+    _guardar_en_disco(estado)
+    return df
+
+def leer_asistencias():
+    """Lee los registros de asistencia, cacheados por versión de la hoja."""
+    try:
+        return _cargar_asistencias(_modificado_actual())
+    except Exception as e:
+        st.error(f"❌ Error al leer de Google Sheets. Verifica que el nombre de la hoja sea correcto. Error: {e}")
+        return pd.DataFrame(columns=COLUMNAS)
+
+@st.cache_data(show_spinner=False)
+def filtrar_asistencias(filtro_texto, fecha_iso, modificado):
+    """Aplica los filtros y arma el CSV del reporte.
+
+    Cacheado por (texto, fecha, modifiedTime): si el usuario toca un widget
+    que no cambia los filtros, el rerun no vuelve a filtrar ni a re-codificar
+    el CSV. La marca de modificación es la misma con la que se cargaron los
+    datos, así cualquier versión nueva de la hoja — venga de esta sesión, de
+    otra o de una edición externa — invalida también los filtros cacheados.
+    """
+    df = leer_asistencias()
+
+    # Componer una sola máscara booleana e indexar una única vez al final:
+    # sin el .copy() defensivo no se duplica el DataFrame entero del caché
+    # (el .loc ya produce un frame nuevo, y la columna auxiliar viene
+    # precalculada del loader, así que acá no se muta nada).
+    mask = np.ones(len(df), dtype=bool)
+
+    if fecha_iso:
+        # Comparación vectorizada sobre datetime64[D]: un compare de int64 en
+        # NumPy, sin construir un objeto date de Python por fila. El array por
+        # día viene precalculado del loader si el frame es el cacheado.
+        estado = _estado_lector()
+        if estado['df'] is df and estado['fecha_day'] is not None:
+            fecha_day = estado['fecha_day']
+        else:
+            fecha_day = df['Fecha'].values.astype('datetime64[D]')
+        mask &= fecha_day == np.datetime64(fecha_iso)
+
+    if filtro_texto:
+        # Un único scan vectorizado sobre la columna '_search' precalculada en
+        # el loader. regex=False evita compilar una expresión regular por
+        # tecleo y usa búsqueda literal de substring (a nivel C con pyarrow).
+        mask &= df['_search'].str.contains(
+            filtro_texto.lower(), regex=False, na=False
+        ).to_numpy(dtype=bool)
+
+    df_filtrado = df.loc[mask].drop(columns=['_search'], errors='ignore')
+
+    # El CSV del reporte se codifica acá para que también quede cacheado.
+    # pyarrow.csv.write_csv serializa en C++; el to_csv de pandas es un
+    # formateador por fila en Python, varias veces más lento en frames grandes.
+    buf = pa.BufferOutputStream()
+    pacsv.write_csv(pa.Table.from_pandas(df_filtrado, preserve_index=False), buf)
+    csv_reporte = buf.getvalue().to_pybytes()
+    return df_filtrado, csv_reporte
+
+# Lock a nivel proceso: si dos sesiones confirman la limpieza a la vez, solo
+# una emite el clear; la otra encuentra la hoja ya vacía y no gasta cuota.
+_lock_limpieza = threading.Lock()
+
+def limpiar_registros_sheets():
+    """Borra todos los registros (dejando solo el encabezado) de Google Sheets."""
+    try:
+        with _lock_limpieza:
+            spreadsheet = get_spreadsheet()
+
+            # Idempotencia: si no hay filas de datos (otra sesión ya limpió),
+            # no hace falta emitir otro clear.
+            primera_fila = spreadsheet.values_get(f"'{NOMBRE_HOJA}'!A2:D2")
+            if not primera_fila.get('values'):
+                return True
+
+            # Vaciar todas las filas menos el encabezado con una sola llamada
+            # values.clear: delete_rows generaba un batchUpdate que borraba fila
+            # por fila del lado del servidor (lentísimo en hojas grandes).
+            spreadsheet.values_clear(f"'{NOMBRE_HOJA}'!A2:D")
+            return True
+    except Exception as e:
+        st.error(f"❌ Error al limpiar la hoja de cálculo: {e}")
+        return False
+
+# --- Funciones de Estado de Limpieza (Mismo uso de Session State) ---
+
+if 'confirmar_limpieza' not in st.session_state:
+    st.session_state.confirmar_limpieza = False
+
+def solicitar_confirmacion():
+    st.session_state.confirmar_limpieza = True
+
+def cancelar_limpieza():
+    # Los callbacks on_click corren justo antes del rerun natural del script:
+    # con cambiar el estado alcanza, no hace falta un st.rerun() explícito.
+    st.session_state.confirmar_limpieza = False
+
+def ejecutar_limpieza_y_recargar():
+    if limpiar_registros_sheets():
+        st.session_state.confirmar_limpieza = False
+        st.success("Historial borrado exitosamente de Google Sheets.")
+        # Una sola transición de estado: invalidar el chequeo de metadata; el
+        # rerun que sigue al callback ya recarga datos y filtros con la marca
+        # nueva, sin una segunda ejecución extra.
+        _modificado_actual.clear()
+
+# --- Configuración y Diseño de la Interfaz (Streamlit) ---
+
+st.set_page_config(page_title="Control de Asistencia Gym - Google Sheets", layout="wide")
+st.title("Sistema de Control de Asistencia (Con Google Sheets) 📝")
+st.markdown("---")
+
+# ===================================================================
+# 1. SECCIÓN DE REGISTRO
+# ===================================================================
+
+col_form, col_spacer = st.columns([1, 0.5])
+
+with col_form:
+    st.header("1. Marcar Asistencia")
+    
+    with st.form("form_asistencia"):
+        nombre = st.text_input("Nombre:")
+        apellido = st.text_input("Apellido:")
+        
+        submit_button = st.form_submit_button("REGISTRAR ASISTENCIA")
+
+    if submit_button:
+        if nombre and apellido:
+            if marcar_asistencia(nombre.strip(), apellido.strip()):
+                st.success(f"✅ ¡Asistencia registrada para **{nombre} {apellido}** en Google Sheets!")
+                # Una sola transición de estado: invalidar el chequeo de
+                # metadata. El resto de este mismo run ya renderiza la tabla
+                # con la marca nueva — el st.rerun() que había acá duplicaba
+                # la ejecución completa del script.
+                _modificado_actual.clear()
+        else:
+            st.error("Por favor, completá tu nombre y apellido.")
+
+st.markdown("---")
+
+# ===================================================================
+# 2. SECCIÓN DE VISUALIZACIÓN, FILTROS Y REPORTES
+# ===================================================================
+
+st.header("2. Lista Histórica de Asistencias")
+
+df_asistencias = leer_asistencias()
+
+if df_asistencias.empty:
+    st.info("Aún no hay asistencias registradas.")
+else:
+    # --- FILTROS ---
+    st.subheader("Filtros y Búsqueda")
+    
+    col_search, col_date, col_total = st.columns(3)
+
+    # Filtro por Nombre/Apellido (Búsqueda)
+    filtro_texto = col_search.text_input("Buscar por Nombre o Apellido:", key="filtro_nombre")
+    
+    # Filtro por Fecha (Reporte por Fecha)
+    # Los extremos vienen precalculados del loader: sin pasadas O(N) acá.
+    fecha_min = df_asistencias.attrs.get('fecha_min')
+    fecha_max = df_asistencias.attrs.get('fecha_max')
+    fecha_min = fecha_min.date() if pd.notna(fecha_min) else datetime.today().date()
+    fecha_max = fecha_max.date() if pd.notna(fecha_max) else datetime.today().date()
+
+    filtro_fecha = col_date.date_input("Filtrar por Fecha Específica:", 
+                                       value=None, 
+                                       min_value=fecha_min, 
+                                       max_value=fecha_max,
+                                       key="filtro_fecha")
+
+   # Aplicar filtros (cacheado: solo se recalcula si cambió algún filtro
+   # o si hay una versión nueva de la hoja)
+    fecha_iso = filtro_fecha.isoformat() if filtro_fecha else None
+    df_filtrado, csv_reporte = filtrar_asistencias(
+        filtro_texto, fecha_iso, _modificado_actual()
+    )
+    
+    # Mostrar totales
+    col_total.metric(label="Total de Asistencias (Filtradas)", value=len(df_filtrado))
+    
+    # Mostrar la tabla filtrada
+    st.markdown("---")
+    st.subheader(f"Resultados ({len(df_filtrado)})")
+    st.dataframe(df_filtrado, use_container_width=True)
+
+    # --- DESCARGA Y LIMPIEZA ---
+    col_download, col_clean = st.columns([1, 1])
+
+    with col_download:
+        st.download_button(
+            label="Descargar Reporte (CSV)",
+            data=csv_reporte,
+            file_name=f'asistencias_gym_reporte_{datetime.now().strftime("%Y%m%d")}.csv',
+            mime='text/csv',
+        )
+    
+    with col_clean:
+        st.markdown("### Administración")
+        
+        if not st.session_state.confirmar_limpieza:
+            if st.button("🔴 LIMPIAR TODO EL HISTORIAL (PELIGRO)", type="secondary", on_click=solicitar_confirmacion):
+                pass
+        else:
+            # Diálogo de confirmación
+            st.warning("⚠️ ¿Estás *totalmente* seguro? Esta acción eliminará **TODO** el historial de asistencias en Google Sheets y es irreversible.")
+            
+            col_confirm_si, col_confirm_no = st.columns(2)
+            
+            with col_confirm_si:
+                st.button("SÍ, BORRAR DEFINITIVAMENTE", type="primary", on_click=ejecutar_limpieza_y_recargar)
+            with col_confirm_no:
+                st.button("NO, CANCELAR", on_click=cancelar_limpieza)
+